@@ -1,9 +1,11 @@
 import os
 import re
 import glob
+import string
+import argparse
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from datetime import datetime
 
 # Regex patterns to match the three log formats.
 # We assume:
@@ -23,82 +25,266 @@ SEND_PATTERN = re.compile(
     r'^(?P<timestamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \[(?P<vm>[A-Z])\] \[SEND\s*\]\s+To: (?P<recipient>[A-Z](?:,\s*[A-Z])*)?, Logical Clock: (?P<logical_clock>\d+)$'
 )
 
-def parse_log_line(line):
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+LOG_FILENAME_PATTERN = re.compile(r'^(?P<vm>[A-Z])\.(?P<run>\d+)\.log$')
+
+# Fixed categories keep the dictionaries identical across chunks, so chunks can
+# be concatenated or written to one Arrow/Parquet dataset without re-encoding.
+VM_DTYPE = pd.CategoricalDtype(list(string.ascii_uppercase))
+EVENT_TYPE_DTYPE = pd.CategoricalDtype(['INTERNAL', 'RECEIVE', 'SEND'])
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+DESCRIBE_INDEX = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+def peers_to_mask(peers):
     """
-    Parse a single log line and extract relevant information.
+    Encode a list of VM names as a bitmask, bit i standing for the i-th letter.
 
-    :param str line: A single line from a log file.
-    :return dict: A dictionary containing the parsed log line data, or None if the line can't be parsed.
+    :param list peers: VM names such as ['B', 'C'], or None.
+    :return int: The bitmask, 0 if there are no peers.
     """
-    line = line.strip()
-    # Try matching INTERNAL first
-    m = INTERNAL_PATTERN.match(line)
-    if m:
-        data = m.groupdict()
-        data['event_type'] = 'INTERNAL'
-        data['sender'] = None
-        data['recipient'] = None
-        data['queue_length'] = None
-    else:
-        m = RECEIVE_PATTERN.match(line)
+    mask = 0
+    for peer in peers or ():
+        mask |= 1 << (ord(peer) - ord('A'))
+    return mask
+
+def mask_to_peers(mask):
+    """
+    Decode a bitmask produced by peers_to_mask.
+
+    :param int mask: The bitmask.
+    :return list: The VM names, in alphabetical order.
+    """
+    return [c for i, c in enumerate(string.ascii_uppercase) if mask >> i & 1]
+
+def _match_log_line(line):
+    """Return (event_type, match) for a stripped log line, or (None, None)."""
+    for event_type, pattern in (('INTERNAL', INTERNAL_PATTERN),
+                                ('RECEIVE', RECEIVE_PATTERN),
+                                ('SEND', SEND_PATTERN)):
+        m = pattern.match(line)
         if m:
-            data = m.groupdict()
-            data['event_type'] = 'RECEIVE'
-            data['recipient'] = None
-            data['queue_length'] = int(data['queue_length'])
-        else:
-            m = SEND_PATTERN.match(line)
-            if m:
-                data = m.groupdict()
-                data['event_type'] = 'SEND'
-                data['sender'] = None
-                data['queue_length'] = None
-                # Clean up recipient: split by comma if more than one.
-                if data.get('recipient'):
-                    data['recipient'] = [x.strip() for x in data['recipient'].split(',')]
-            else:
-                return None
+            return event_type, m
+    return None, None
 
-    # Convert timestamp and logical clock.
-    try:
-        data['timestamp'] = datetime.strptime(data['timestamp'], '%Y-%m-%d %H:%M:%S')
-    except Exception as e:
-        print("Timestamp conversion error:", e, line)
-        return None
-    data['logical_clock'] = int(data['logical_clock'])
-    return data
+def _build_chunk(columns, vm, run, filename, filename_dtype):
+    """Turn the raw column lists collected by iter_log_chunks into a compact DataFrame."""
+    n = len(columns['logical_clock'])
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(columns['timestamp'], format=TIMESTAMP_FORMAT).astype('datetime64[s]'),
+        'vm': pd.Categorical([vm] * n, dtype=VM_DTYPE),
+        'run': np.full(n, run, dtype=np.int32),
+        'filename': pd.Categorical([filename] * n, dtype=filename_dtype),
+        'event_type': pd.Categorical(columns['event_type'], dtype=EVENT_TYPE_DTYPE),
+        'logical_clock': np.array(columns['logical_clock'], dtype=np.int32),
+        'sender': pd.Categorical(columns['sender'], dtype=VM_DTYPE),
+        'queue_length': pd.array(columns['queue_length'], dtype='Int32'),
+        'recipient_mask': np.array(columns['recipient_mask'], dtype=np.uint32),
+    })
 
-def load_log_file(filepath):
+def iter_log_chunks(filepath, chunksize=DEFAULT_CHUNKSIZE, filename_dtype=None):
     """
-    Load a single log file and parse its entries.
+    Parse a log file into compact DataFrames of at most chunksize rows each.
+
+    Columns are stored with compact dtypes: categoricals for vm, sender and
+    event_type, int32 for logical clocks and run, nullable Int32 for queue
+    lengths and a uint32 peer bitmask (see peers_to_mask) instead of a
+    recipient list. The run number is taken from the file name (A.3.log is
+    run 3 of VM A). Simulations started through main.run_simulation log all
+    of their VMs under one shared run number; a VM started on its own with
+    main.vm_main uses its own next file index instead, which need not match
+    the other VMs'.
 
     :param str filepath: Path to the log file to load.
-    :return list: A list of dictionaries, each containing the parsed log line data.
+    :param int chunksize: Maximum number of rows per yielded DataFrame.
+    :param pd.CategoricalDtype filename_dtype: Shared categories for the filename
+        column, so chunks of several files concatenate without losing the categorical.
+    :return generator: Yields pd.DataFrame chunks in file order.
     """
-    entries = []
+    filename = os.path.basename(filepath)
+    if filename_dtype is None:
+        filename_dtype = pd.CategoricalDtype([filename])
+    name_match = LOG_FILENAME_PATTERN.match(filename)
+    file_vm = name_match.group('vm') if name_match else None
+    run = int(name_match.group('run')) if name_match else 0
+
+    def empty_columns():
+        return {key: [] for key in ('timestamp', 'event_type', 'logical_clock',
+                                    'sender', 'queue_length', 'recipient_mask')}
+
+    columns = empty_columns()
+    vm = file_vm
     with open(filepath, 'r') as f:
         for line in f:
-            # Parse the line, returning None if it can't be parsed.
-            parsed = parse_log_line(line)
-            if parsed:
-                # Add the filename to the parsed data.
-                parsed['filename'] = os.path.basename(filepath)
-                entries.append(parsed)
-    return entries
+            event_type, m = _match_log_line(line.strip())
+            if m is None:
+                continue
+            vm = vm or m.group('vm')
+            columns['timestamp'].append(m.group('timestamp'))
+            columns['event_type'].append(event_type)
+            columns['logical_clock'].append(int(m.group('logical_clock')))
+            if event_type == 'RECEIVE':
+                columns['sender'].append(m.group('sender'))
+                columns['queue_length'].append(int(m.group('queue_length')))
+            else:
+                columns['sender'].append(None)
+                columns['queue_length'].append(None)
+            if event_type == 'SEND' and m.group('recipient'):
+                columns['recipient_mask'].append(peers_to_mask(x.strip() for x in m.group('recipient').split(',')))
+            else:
+                columns['recipient_mask'].append(0)
+
+            if len(columns['logical_clock']) >= chunksize:
+                yield _build_chunk(columns, vm, run, filename, filename_dtype)
+                columns = empty_columns()
+    if columns['logical_clock']:
+        yield _build_chunk(columns, vm, run, filename, filename_dtype)
 
-def load_all_logs(log_directory):
+def iter_all_logs(log_directory, chunksize=DEFAULT_CHUNKSIZE):
     """
-    Load all log files in the given directory and parse their entries.
+    Parse every log file in the directory, one chunk at a time.
 
     :param str log_directory: Directory containing the log files to load.
-    :return pd.DataFrame: A Pandas DataFrame containing the parsed log line data.
+    :param int chunksize: Maximum number of rows per yielded DataFrame.
+    :return generator: Yields pd.DataFrame chunks, file by file.
     """
     file_pattern = os.path.join(log_directory, '*.log')
-    all_entries = []
-    for filepath in glob.glob(file_pattern):
-        entries = load_log_file(filepath)
-        all_entries.extend(entries)
-    return pd.DataFrame(all_entries)
+    filepaths = sorted(glob.glob(file_pattern))
+    filename_dtype = pd.CategoricalDtype([os.path.basename(filepath) for filepath in filepaths])
+    for filepath in filepaths:
+        yield from iter_log_chunks(filepath, chunksize, filename_dtype)
+
+def load_log_file(filepath, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Load a single log file and parse its entries.
+
+    :param str filepath: Path to the log file to load.
+    :param int chunksize: Number of rows parsed at a time before compacting.
+    :return pd.DataFrame: A compact DataFrame, see iter_log_chunks for the columns.
+    """
+    chunks = list(iter_log_chunks(filepath, chunksize))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+def load_all_logs(log_directory, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Load all log files in the given directory and parse their entries.
+
+    :param str log_directory: Directory containing the log files to load.
+    :param int chunksize: Number of rows parsed at a time before compacting.
+    :return pd.DataFrame: A compact DataFrame, see iter_log_chunks for the columns.
+    """
+    chunks = list(iter_all_logs(log_directory, chunksize))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+def _describe_counts(counts):
+    """
+    Build the same statistics as Series.describe() from a value -> count table.
+
+    :param pd.Series counts: Occurrences of each integer value.
+    :return pd.Series: count, mean, std, min, 25%, 50%, 75% and max.
+    """
+    counts = counts[counts > 0].sort_index()
+    values = counts.index.to_numpy(dtype=np.float64)
+    weights = counts.to_numpy(dtype=np.float64)
+    n = weights.sum()
+    if n == 0:
+        # Same shape as describe() on an all-NaN column.
+        return pd.Series([0.0] + [np.nan] * 7, index=DESCRIBE_INDEX, dtype=np.float64)
+    mean = (values * weights).sum() / n
+    std = np.sqrt(((values - mean) ** 2 * weights).sum() / (n - 1)) if n > 1 else np.nan
+    # Linear interpolation between order statistics, as pandas does.
+    cumulative = np.cumsum(weights)
+    def quantile(q):
+        position = q * (n - 1)
+        lower = values[np.searchsorted(cumulative, np.floor(position) + 1)]
+        upper = values[np.searchsorted(cumulative, np.ceil(position) + 1)]
+        return lower + (upper - lower) * (position - np.floor(position))
+    return pd.Series({
+        'count': n, 'mean': mean, 'std': std, 'min': values[0],
+        '25%': quantile(0.25), '50%': quantile(0.5), '75%': quantile(0.75), 'max': values[-1],
+    })
+
+def summarize_logs(log_directory, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Compute the statistics printed by analyze_log_data without holding the logs in memory.
+
+    Clock jumps and queue lengths are small integers, so keeping a value ->
+    count table per VM is enough to get exact statistics while only one chunk
+    is loaded at a time. Log files are assumed to be in chronological order,
+    which is how the simulation writes them.
+
+    :param str log_directory: Directory containing the log files to load.
+    :param int chunksize: Maximum number of rows loaded at a time.
+    :return dict: {'clock_diff': {vm: pd.Series}, 'queue_length': {vm: pd.Series}} of describe()-style statistics.
+    """
+    clock_diff_counts = {}
+    queue_length_counts = {}
+    last_clock = {}
+    for chunk in iter_all_logs(log_directory, chunksize):
+        vm = chunk['vm'].iat[0]
+        filename = chunk['filename'].iat[0]
+        clocks = chunk['logical_clock'].to_numpy(dtype=np.int64)
+        # Carry the previous chunk's last clock over so jumps at chunk borders are counted.
+        previous = last_clock.get(filename)
+        diffs = np.diff(clocks, prepend=previous) if previous is not None else np.diff(clocks)
+        last_clock[filename] = clocks[-1]
+        counts = pd.Series(diffs).value_counts()
+        clock_diff_counts[vm] = clock_diff_counts[vm].add(counts, fill_value=0) if vm in clock_diff_counts else counts
+
+        queue_lengths = chunk.loc[chunk['event_type'] == 'RECEIVE', 'queue_length']
+        if len(queue_lengths):
+            counts = queue_lengths.astype(np.int64).value_counts()
+            queue_length_counts[vm] = queue_length_counts[vm].add(counts, fill_value=0) if vm in queue_length_counts else counts
+
+    return {
+        'clock_diff': {vm: _describe_counts(c) for vm, c in sorted(clock_diff_counts.items())},
+        'queue_length': {vm: _describe_counts(c) for vm, c in sorted(queue_length_counts.items())},
+    }
+
+def export_logs(log_directory, output_directory, format='parquet', chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Stream all logs into a Parquet or Arrow IPC dataset partitioned by run and VM.
+
+    Files are written hive-style (run=0/vm=A/...), so a single run or VM can be
+    read back without scanning the rest. See iter_log_chunks for when the run
+    number is shared across VMs. Requires pyarrow.
+
+    :param str log_directory: Directory containing the log files to load.
+    :param str output_directory: Directory to write the dataset to.
+    :param str format: 'parquet' or 'arrow'.
+    :param int chunksize: Maximum number of rows loaded at a time.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if format not in ('parquet', 'arrow'):
+        raise ValueError(f"Unsupported export format: {format}")
+    file_format = 'ipc' if format == 'arrow' else 'parquet'
+
+    chunks = iter_all_logs(log_directory, chunksize)
+    first = next(chunks, None)
+    if first is None:
+        return
+    schema = pa.Schema.from_pandas(first, preserve_index=False)
+
+    def batches():
+        for chunk in (first, *chunks):
+            yield from pa.Table.from_pandas(chunk, schema=schema, preserve_index=False).to_batches()
+
+    ds.write_dataset(
+        batches(),
+        output_directory,
+        schema=schema,
+        format=file_format,
+        partitioning=['run', 'vm'],
+        partitioning_flavor='hive',
+        existing_data_behavior='overwrite_or_ignore',
+    )
 
 def analyze_log_data(df, save=None):
     # Sort by timestamp per VM and per file.
@@ -106,7 +292,7 @@ def analyze_log_data(df, save=None):
 
     # Calculate the difference in logical clock between consecutive events per VM & file.
     # And display descriptive statistics for clock differences for each VM.
-    df['clock_diff'] = df.groupby(['vm', 'filename'])['logical_clock'].diff()
+    df['clock_diff'] = df.groupby(['vm', 'filename'], observed=True)['logical_clock'].diff()
     for vm in df['vm'].unique():
         vm_df = df[df['vm'] == vm]
         print(f"\nDescriptive Statistics for VM {vm}:")
@@ -122,8 +308,8 @@ def analyze_log_data(df, save=None):
     # Plot logical clock progression over time for each VM (and file).
     fig, ax = plt.subplots(figsize=(10, 6))
     colors = {'A': 'r', 'B': 'g', 'C': 'b'}
-    for vm, group in df.groupby('vm'):
-        for filename, sub_group in group.groupby('filename'):
+    for vm, group in df.groupby('vm', observed=True):
+        for filename, sub_group in group.groupby('filename', observed=True):
             ax.plot(sub_group['timestamp'], sub_group['logical_clock'], 
                     linestyle='-', color=colors[vm], alpha=0.3)
     ax.set_xlabel("System Time")
@@ -142,8 +328,27 @@ def analyze_log_data(df, save=None):
     return df
 
 if __name__ == "__main__":
-    log_directory = "./log"  # Update with the correct log directory path.
-    df = load_all_logs(log_directory)
-    df = analyze_log_data(df, save=f"{log_directory}/logical_clock_progression.png")
-    # Optionally export the aggregated data for further analysis.
-    # df.to_csv(f"{log_directory}/aggregated_log_analysis.csv", index=False)
+    parser = argparse.ArgumentParser(description="Analyze the logical clock logs.")
+    parser.add_argument("--log-directory", default="./log", help="directory containing the log files")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows loaded at a time")
+    parser.add_argument("--summary-only", action="store_true",
+                        help="print statistics out-of-core instead of loading everything and plotting")
+    parser.add_argument("--export", choices=["parquet", "arrow"], default=None,
+                        help="export the logs as a dataset partitioned by run and VM")
+    args = parser.parse_args()
+    log_directory = args.log_directory
+
+    if args.summary_only:
+        summary = summarize_logs(log_directory, args.chunksize)
+        for vm, stats in summary['clock_diff'].items():
+            print(f"\nDescriptive Statistics for VM {vm}:")
+            print(stats)
+        for vm, stats in summary['queue_length'].items():
+            print(f"\nQueue Length Statistics for VM {vm}:")
+            print(stats)
+    else:
+        df = load_all_logs(log_directory, args.chunksize)
+        df = analyze_log_data(df, save=f"{log_directory}/logical_clock_progression.png")
+
+    if args.export:
+        export_logs(log_directory, f"{log_directory}/{args.export}", format=args.export, chunksize=args.chunksize)
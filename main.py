@@ -1,3 +1,4 @@
+import argparse
 import json
 import random
 import threading
@@ -6,7 +7,9 @@ from concurrent import futures
 from queue import Queue
 import grpc
 
-from tools import get_peers, send_message_to_peer, log_event, vm_log_filename, get_next_log_filename
+import tools
+from network import wrap_servicer
+from tools import get_peers, send_message_to_peer, log_event, vm_log_filename, get_next_log_filename, get_next_run_index, flush_outbound, drop_outbound, close_channels
 import logic_clock_pb2
 import logic_clock_pb2_grpc
 
@@ -26,85 +29,255 @@ class VMServiceServicer(logic_clock_pb2_grpc.VMServiceServicer):
         return logic_clock_pb2.MessageReply(status="OK")
 
 
-def serve_gRPC(port, message_queue, vm_name):
+def create_gRPC_server(port, message_queue, vm_name):
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    servicer = VMServiceServicer(message_queue)
+    servicer = wrap_servicer(VMServiceServicer(message_queue), tools.network_emulator, vm_name)
     logic_clock_pb2_grpc.add_VMServiceServicer_to_server(servicer, server)
 
     server.add_insecure_port(f'[::]:{port}')
     server.start()
     print(f"[{vm_name}] gRPC Server listening on port {port}")
+    return server
+
 
+def serve_gRPC(port, message_queue, vm_name):
+    server = create_gRPC_server(port, message_queue, vm_name)
     server.wait_for_termination()
 
 
-def vm_main(vm_config):
+class VirtualMachine:
     """
-    The main function for a single VM:
-      - Starts a gRPC server in a separate thread.
-      - Runs the "logical clock" loop, which processes queued messages or triggers local events.
+    Handle for a single VM that can be started, run for a bounded number of
+    ticks or seconds, stopped from another thread and shut down cleanly.
     """
-    vm_name = vm_config["name"]
-    port = vm_config["port"]
-    clock_rate = vm_config["clock_rate"]
 
-    vm_log_filename[vm_name] = get_next_log_filename(vm_name)
+    def __init__(self, vm_config, stop_event=None):
+        self.name = vm_config["name"]
+        self.port = vm_config["port"]
+        self.clock_rate = vm_config["clock_rate"]
+        self.peers = get_peers(self.name, 2)
 
-    peers = get_peers(vm_name, 2)
+        self.local_logical_clock = 0
+        # Thread-safe queue to store incoming messages
+        self.message_queue = Queue()
+        # Several VMs may share one event so a whole simulation stops together.
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.server = None
+        self.error = None
 
-    local_logical_clock = 0
+        self.ticks = 0
+        self.events = {"INTERNAL": 0, "SEND": 0, "RECEIVE": 0}
+        self.max_queue_length = 0
+        self.lost_messages = 0
+        self.elapsed = 0.0
 
-    # Thread-safe queue to store incoming messages
-    message_queue = Queue()
+    def start(self, run=None):
+        """
+        Open the log file and start the gRPC server.
 
-    # Start the gRPC server in a separate thread
-    server_thread = threading.Thread(
-        target=serve_gRPC,
-        args=(port, message_queue, vm_name),
-        daemon=True
-    )
-    server_thread.start()
+        :param int run: Run number to log under, shared by the VMs of one simulation.
+            None picks this VM's next unused log index.
+        """
+        vm_log_filename[self.name] = get_next_log_filename(self.name, run)
+        self.server = create_gRPC_server(self.port, self.message_queue, self.name)
+        print(f"[{self.name}] Initialized with clock_rate={self.clock_rate} instructions/second")
 
-    print(f"[{vm_name}] Initialized with clock_rate={clock_rate} instructions/second")
+    def stop(self):
+        """Ask the clock loop to exit after the current tick. Safe to call from any thread."""
+        self.stop_event.set()
 
-    # Main loop: execute 'clock_rate' instructions per real-world second.
-    try:
-        while True:
-            time.sleep(1.0 / clock_rate)
-
-            # 1) If there's a message in the queue, process it
-            if not message_queue.empty():
-                qsize = message_queue.qsize()
-                msg = message_queue.get()
-                # Update logical clock: max(local, remote) + 1
-                local_logical_clock = max(local_logical_clock, msg["clock"]) + 1
-                log_event(vm_name, "RECEIVE", local_logical_clock, queue_length=qsize, target_peers=msg["content"])
-
-            # 2) Otherwise, pick a random number 1-10 to decide sending or internal event
+    def send(self, peer):
+        """Send the local clock to a peer; a failed RPC counts as a message lost in the network."""
+        try:
+            send_message_to_peer(peer, self.local_logical_clock, self.name)
+        except grpc.RpcError:
+            self.lost_messages += 1
+
+    def tick(self):
+        """Run a single clock cycle: process one queued message or trigger a local event."""
+        peers = self.peers
+        self.ticks += 1
+
+        # 1) If there's a message in the queue, process it
+        if not self.message_queue.empty():
+            qsize = self.message_queue.qsize()
+            self.max_queue_length = max(self.max_queue_length, qsize)
+            msg = self.message_queue.get()
+            # Update logical clock: max(local, remote) + 1
+            self.local_logical_clock = max(self.local_logical_clock, msg["clock"]) + 1
+            log_event(self.name, "RECEIVE", self.local_logical_clock, queue_length=qsize, target_peers=msg["content"])
+            self.events["RECEIVE"] += 1
+
+        # 2) Otherwise, pick a random number 1-10 to decide sending or internal event
+        else:
+            r = random.randint(1, 10)  # TODO: simulate different event probabilities
+            if r == 1:
+                self.send(peers[0])
+                self.local_logical_clock += 1
+                log_event(self.name, "SEND", self.local_logical_clock, target_peers=[peers[0]])
+                self.events["SEND"] += 1
+            elif r == 2:
+                self.send(peers[0])
+                self.local_logical_clock += 1
+                log_event(self.name, "SEND", self.local_logical_clock, target_peers=[peers[1]])
+                self.events["SEND"] += 1
+            elif r == 3:
+                self.send(peers[0])
+                self.send(peers[1])
+                self.local_logical_clock += 1
+                log_event(self.name, "SEND", self.local_logical_clock, target_peers=peers)
+                self.events["SEND"] += 1
             else:
-                r = random.randint(1, 10)  # TODO: simulate different event probabilities
-                if r == 1:
-                    send_message_to_peer(peers[0], local_logical_clock, vm_name)
-                    local_logical_clock += 1
-                    log_event(vm_name, "SEND", local_logical_clock, target_peers=[peers[0]])
-                elif r == 2:
-                    send_message_to_peer(peers[0], local_logical_clock, vm_name)
-                    local_logical_clock += 1
-                    log_event(vm_name, "SEND", local_logical_clock, target_peers=[peers[1]])
-                elif r == 3:
-                    send_message_to_peer(peers[0], local_logical_clock, vm_name)
-                    send_message_to_peer(peers[1], local_logical_clock, vm_name)
-                    local_logical_clock += 1
-                    log_event(vm_name, "SEND", local_logical_clock, target_peers=peers)
-                else:
-                    # Internal event
-                    local_logical_clock += 1
-                    log_event(vm_name, "INTERNAL", local_logical_clock)
+                # Internal event
+                self.local_logical_clock += 1
+                log_event(self.name, "INTERNAL", self.local_logical_clock)
+                self.events["INTERNAL"] += 1
+
+    def run(self, ticks=None, duration=None):
+        """
+        Execute 'clock_rate' instructions per real-world second until stopped.
+
+        :param int ticks: Stop after this many ticks, or None for no limit.
+        :param float duration: Stop after this many seconds, or None for no limit.
+        :return dict: The run summary, see summary().
+        """
+        interval = 1.0 / self.clock_rate
+        start = time.monotonic()
+        deadline = None if duration is None else start + duration
+        run_ticks = 0
+        while ticks is None or run_ticks < ticks:
+            # Waiting on the event instead of sleeping lets stop() interrupt a tick.
+            if self.stop_event.wait(interval):
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            self.tick()
+            run_ticks += 1
+        self.elapsed += time.monotonic() - start
+        return self.summary()
 
+    def shutdown(self, grace=1.0):
+        """
+        Flush outbound messages and stop the gRPC server.
+
+        :param float grace: Seconds to let in-flight RPCs finish before they are cancelled.
+        :return dict: The run summary, see summary().
+        """
+        self.stop()
+        flush_outbound(timeout=grace)
+        if self.server is not None:
+            self.server.stop(grace).wait()
+            self.server = None
+        print(f"[{self.name}] Shutting down...")
+        return self.summary()
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "clock_rate": self.clock_rate,
+            "ticks": self.ticks,
+            "events": dict(self.events),
+            "final_clock": self.local_logical_clock,
+            "max_queue_length": self.max_queue_length,
+            "unprocessed_messages": self.message_queue.qsize(),
+            "lost_messages": self.lost_messages,
+            "elapsed": self.elapsed,
+            "achieved_rate": self.ticks / self.elapsed if self.elapsed > 0 else 0.0,
+            "error": self.error,
+        }
+
+
+def vm_main(vm_config, ticks=None, duration=None, grace=1.0):
+    """
+    The main function for a single VM:
+      - Starts a gRPC server.
+      - Runs the "logical clock" loop, which processes queued messages or triggers local events,
+        until the tick or time limit is reached (forever if neither is given).
+      - Stops the server and returns the VM's run summary.
+    """
+    vm = VirtualMachine(vm_config)
+    vm.start()
+    try:
+        vm.run(ticks=ticks, duration=duration)
     except KeyboardInterrupt:
-        print(f"[{vm_name}] Shutting down...")
+        pass
+    return vm.shutdown(grace)
 
-def main():
+
+def _run_vm(vm, ticks, duration):
+    """Thread target for run_simulation: record a failing clock loop instead of losing it."""
+    start = time.monotonic()
+    try:
+        vm.run(ticks=ticks, duration=duration)
+    except Exception as e:
+        vm.elapsed += time.monotonic() - start
+        vm.error = e
+        print(f"[{vm.name}] Clock loop failed: {e!r}")
+
+
+def run_simulation(vm_list, ticks=None, duration=None, grace=1.0, stop_event=None):
+    """
+    Run every VM in its own thread and shut them all down together.
+
+    Servers are only stopped once every clock loop has finished, so a VM that
+    reaches its tick limit early can still receive from slower peers. A VM
+    whose clock loop raises is reported through the "error" field of its
+    summary; the other VMs keep running.
+
+    :param list vm_list: VM configs as found in config.json.
+    :param int ticks: Ticks each VM runs for, or None for no limit.
+    :param float duration: Seconds each VM runs for, or None for no limit.
+    :param float grace: Grace period passed to each server's stop().
+    :param threading.Event stop_event: Set it from another thread to end the run early.
+    :return list: The run summary of each VM, in config order.
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+    vms = [VirtualMachine(vm_config, stop_event) for vm_config in vm_list]
+    # Log every VM under the same run number so log_analysis can group them.
+    run = get_next_run_index([vm.name for vm in vms])
+    started = []
+    vm_threads = []
+    try:
+        for vm in vms:
+            vm.start(run)
+            started.append(vm)
+
+        for vm in vms:
+            t = threading.Thread(
+                target=_run_vm,
+                args=(vm, ticks, duration),
+                daemon=True
+            )
+            t.start()
+            vm_threads.append(t)
+
+        try:
+            for t in vm_threads:
+                # Join with a timeout so KeyboardInterrupt is still delivered.
+                while t.is_alive():
+                    t.join(0.5)
+        except KeyboardInterrupt:
+            print("[MAIN] Interrupted, stopping VMs...")
+            stop_event.set()
+    except BaseException:
+        # A VM failed to start: stop the ones already running before re-raising.
+        stop_event.set()
+        raise
+    finally:
+        for t in vm_threads:
+            t.join()
+
+        # Channels are closed below, so anything not delivered within the grace
+        # period is dropped rather than left to fail against a closed channel.
+        if not flush_outbound(timeout=grace):
+            dropped = drop_outbound()
+            print(f"[MAIN] Dropped {dropped} undelivered messages")
+        summaries = [vm.shutdown(grace) for vm in started]
+        close_channels()
+    return summaries
+
+def main(ticks=None, duration=None):
     with open('config.json', 'r') as f:
         config_data = json.load(f)
 
@@ -112,22 +285,19 @@ def main():
     # [ { "name": "A", "port": 50051, "clock_rate": 2 }, ... ]
     vm_list = config_data["VMs"]
 
-    vm_threads = []
-    for vm_config in vm_list:
-        t = threading.Thread(
-            target=vm_main,
-            args=(vm_config,),
-            daemon=True
-        )
-        t.start()
-        vm_threads.append(t)
-
-    try:
-        while True:
-            time.sleep(600)
-    except KeyboardInterrupt:
-        print("[MAIN] Interrupted, exiting...")
+    summaries = run_simulation(vm_list, ticks=ticks, duration=duration)
+    for summary in summaries:
+        print(f"[{summary['name']}] ticks={summary['ticks']}, events={summary['events']}, "
+              f"final clock={summary['final_clock']}, max queue={summary['max_queue_length']}, "
+              f"rate={summary['achieved_rate']:.2f}/s")
+        if summary['error'] is not None:
+            print(f"[{summary['name']}] Failed: {summary['error']!r}")
+    return summaries
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the logical clock simulation.")
+    parser.add_argument("--ticks", type=int, default=None, help="stop each VM after this many ticks")
+    parser.add_argument("--duration", type=float, default=None, help="stop each VM after this many seconds")
+    args = parser.parse_args()
+    main(ticks=args.ticks, duration=args.duration)
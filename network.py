@@ -0,0 +1,283 @@
+import heapq
+import random
+import threading
+import time
+import grpc
+
+import logic_clock_pb2
+
+# Default profile applied to every link that has no entry under "links".
+# All times are in milliseconds.
+DEFAULT_LINK = {
+    "latency_ms": 0.0,
+    "jitter_ms": 0.0,
+    "distribution": "constant",
+    "drop_rate": 0.0,
+    "reorder_rate": 0.0,
+    "reorder_delay_ms": 100.0,
+}
+
+DISTRIBUTIONS = ("constant", "uniform", "normal", "exponential")
+
+# Deadline in seconds for every peer RPC, so one unresponsive peer can hold up
+# neither a VM's clock loop nor the scheduler thread that every link shares.
+DELIVERY_TIMEOUT = 2.0
+
+
+class DeliveryScheduler:
+    """
+    Single background thread that runs delayed deliveries in due-time order.
+    Messages held for longer are overtaken by later ones, which is how
+    latency, jitter and reordering show up at the receiver.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._in_flight = 0
+
+    def schedule(self, delay, fn, *args, **kwargs):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, fn, args, kwargs))
+            self._seq += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap) + self._in_flight
+
+    def flush(self, timeout=None):
+        """
+        Wait until every scheduled message has been delivered.
+
+        :param float timeout: Maximum seconds to wait, or None to wait indefinitely.
+        :return bool: True if nothing is left in flight.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def clear(self):
+        """
+        Drop every message that is still waiting to be delivered.
+
+        :return int: The number of messages dropped.
+        """
+        with self._cond:
+            dropped = len(self._heap)
+            self._heap.clear()
+            self._cond.notify_all()
+            return dropped
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, fn, args, kwargs = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                self._in_flight += 1
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                # The peer went away, timed out or its channel was closed while the
+                # message was in flight: it is lost, exactly as it would be on a
+                # real network. The thread must survive to serve the other links.
+                pass
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+
+class NetworkEmulator:
+    """
+    Per-link latency, jitter, drop, reordering and partition model.
+
+    Built from the optional "network" section of config.json:
+
+        "network": {
+            "enabled": true,
+            "seed": 42,
+            "default": {"latency_ms": 20, "jitter_ms": 5, "distribution": "normal"},
+            "links": {"A->B": {"drop_rate": 0.1}},
+            "partitions": [["A"], ["B", "C"]]
+        }
+
+    Links are directed ("A->B"); "A<->B" sets both directions. VMs listed in
+    different partition groups cannot reach each other; VMs not listed in any
+    group can reach everybody.
+    """
+
+    def __init__(self, default=None, links=None, partitions=None, seed=None):
+        self.default = _link_profile(DEFAULT_LINK, default or {})
+        self.links = {}
+        for key, overrides in (links or {}).items():
+            profile = _link_profile(self.default, overrides)
+            if "<->" in key:
+                a, b = (x.strip() for x in key.split("<->"))
+                self.links[(a, b)] = profile
+                self.links[(b, a)] = profile
+            else:
+                a, b = (x.strip() for x in key.split("->"))
+                self.links[(a, b)] = profile
+        self.partition_of = {}
+        for i, group in enumerate(partitions or []):
+            for name in group:
+                self.partition_of[name] = i
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.scheduler = DeliveryScheduler()
+
+    @classmethod
+    def from_config(cls, network_config):
+        """
+        Build an emulator from the "network" config section.
+
+        :param dict network_config: The "network" section, or None.
+        :return NetworkEmulator: The emulator, or None if emulation is disabled.
+        """
+        if not network_config or not network_config.get("enabled", False):
+            return None
+        return cls(
+            default=network_config.get("default"),
+            links=network_config.get("links"),
+            partitions=network_config.get("partitions"),
+            seed=network_config.get("seed"),
+        )
+
+    def link(self, src, dst):
+        return self.links.get((src, dst), self.default)
+
+    def is_partitioned(self, src, dst):
+        a = self.partition_of.get(src)
+        b = self.partition_of.get(dst)
+        return a is not None and b is not None and a != b
+
+    def set_partitions(self, partitions):
+        """Replace the partition groups at runtime, e.g. to heal or split the network."""
+        partition_of = {}
+        for i, group in enumerate(partitions or []):
+            for name in group:
+                partition_of[name] = i
+        self.partition_of = partition_of
+
+    def should_drop(self, src, dst):
+        if self.is_partitioned(src, dst):
+            return True
+        drop_rate = self.link(src, dst)["drop_rate"]
+        if drop_rate <= 0:
+            return False
+        with self._rng_lock:
+            return self.rng.random() < drop_rate
+
+    def sample_delay(self, src, dst):
+        """
+        Draw the one-way delay for a message on the src->dst link.
+
+        "uniform" spreads it over latency +/- jitter, "normal" uses jitter as
+        the standard deviation around latency, and "exponential" adds an
+        exponential tail with mean jitter on top of latency as a floor.
+        "constant" ignores jitter.
+
+        :return float: Delay in seconds, never negative.
+        """
+        profile = self.link(src, dst)
+        latency = profile["latency_ms"]
+        jitter = profile["jitter_ms"]
+        distribution = profile["distribution"]
+        with self._rng_lock:
+            if distribution == "uniform":
+                delay = self.rng.uniform(latency - jitter, latency + jitter)
+            elif distribution == "normal":
+                delay = self.rng.gauss(latency, jitter)
+            elif distribution == "exponential":
+                delay = latency + (self.rng.expovariate(1.0 / jitter) if jitter > 0 else 0.0)
+            else:
+                delay = latency
+            if profile["reorder_rate"] > 0 and self.rng.random() < profile["reorder_rate"]:
+                delay += profile["reorder_delay_ms"]
+        return max(delay, 0.0) / 1000.0
+
+
+class FaultInjectingStub:
+    """
+    Drop-in replacement for VMServiceStub that routes SendMessage through the
+    emulator. Delayed messages are handed to the scheduler so the caller's
+    clock loop is never blocked by simulated latency.
+    """
+
+    def __init__(self, stub, emulator, src, dst):
+        self.stub = stub
+        self.emulator = emulator
+        self.src = src
+        self.dst = dst
+
+    def SendMessage(self, request, timeout=DELIVERY_TIMEOUT):
+        if self.emulator.should_drop(self.src, self.dst):
+            return logic_clock_pb2.MessageReply(status="DROPPED")
+        delay = self.emulator.sample_delay(self.src, self.dst)
+        if delay <= 0:
+            return self.stub.SendMessage(request, timeout=timeout)
+        self.emulator.scheduler.schedule(delay, self.stub.SendMessage, request, timeout=timeout)
+        return logic_clock_pb2.MessageReply(status="DELAYED")
+
+
+class FaultInjectingServicer:
+    """
+    Wraps a VMServiceServicer so that a partition also holds against senders
+    that do not go through a FaultInjectingStub. The sender is taken from the
+    request content, which carries the sending VM's name.
+    """
+
+    def __init__(self, servicer, emulator, vm_name):
+        self.servicer = servicer
+        self.emulator = emulator
+        self.vm_name = vm_name
+
+    def SendMessage(self, request, context):
+        if self.emulator.is_partitioned(request.content, self.vm_name):
+            context.abort(grpc.StatusCode.UNAVAILABLE, f"{request.content} is partitioned from {self.vm_name}")
+        return self.servicer.SendMessage(request, context)
+
+
+def wrap_stub(stub, emulator, src, dst):
+    """Return the stub unchanged when emulation is disabled."""
+    if emulator is None:
+        return stub
+    return FaultInjectingStub(stub, emulator, src, dst)
+
+
+def wrap_servicer(servicer, emulator, vm_name):
+    """Return the servicer unchanged when emulation is disabled."""
+    if emulator is None:
+        return servicer
+    return FaultInjectingServicer(servicer, emulator, vm_name)
+
+
+def _link_profile(base, overrides):
+    profile = dict(base)
+    for key, value in overrides.items():
+        if key not in DEFAULT_LINK:
+            raise ValueError(f"Unknown network link option: {key}")
+        profile[key] = value
+    if profile["distribution"] not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {profile['distribution']}")
+    for key in ("drop_rate", "reorder_rate"):
+        if not 0.0 <= profile[key] <= 1.0:
+            raise ValueError(f"{key} must be between 0 and 1")
+    return profile
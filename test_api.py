@@ -10,7 +10,8 @@ from unittest.mock import MagicMock, patch
 from tools import get_peers, log_event, send_message_to_peer, init
 import logic_clock_pb2
 import logic_clock_pb2_grpc
-from main import VMServiceServicer, serve_gRPC
+from network import NetworkEmulator
+from main import VMServiceServicer, VirtualMachine, serve_gRPC, run_simulation
 
 
 @pytest.fixture
@@ -78,6 +79,123 @@ def test_init():
     assert vm_list[0]["clock_rate"] == 2
 
 
+@pytest.fixture
+def lifecycle_vms(tmp_path, monkeypatch):
+    """Fixture for VM configs on ports that do not clash with the other tests, logging to a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("log")
+    vms = [
+        {"name": "A", "port": 50071, "clock_rate": 50},
+        {"name": "B", "port": 50072, "clock_rate": 100},
+        {"name": "C", "port": 50073, "clock_rate": 150},
+    ]
+    with patch("tools.vm_list", vms):
+        yield vms
+
+
+def test_run_simulation_for_fixed_ticks(lifecycle_vms):
+    """Tests that every VM runs exactly the requested number of ticks and reports a summary."""
+    summaries = run_simulation(lifecycle_vms, ticks=20, grace=0.5)
+
+    assert [s["name"] for s in summaries] == ["A", "B", "C"]
+    for summary in summaries:
+        assert summary["ticks"] == 20
+        assert sum(summary["events"].values()) == 20
+        assert summary["final_clock"] >= 20
+        assert summary["achieved_rate"] > 0
+
+    # Servers are stopped, so the ports refuse RPCs.
+    with grpc.insecure_channel("localhost:50071") as channel:
+        stub = logic_clock_pb2_grpc.VMServiceStub(channel)
+        with pytest.raises(grpc.RpcError) as excinfo:
+            stub.SendMessage(logic_clock_pb2.MessageRequest(clock=0, content="TEST"), timeout=2)
+    assert excinfo.value.code() == grpc.StatusCode.UNAVAILABLE
+
+
+def test_run_simulation_stops_started_servers_on_start_failure(lifecycle_vms):
+    """Tests that servers already started are stopped when a later VM fails to start."""
+    servers = [MagicMock(), MagicMock()]
+    with patch("main.create_gRPC_server", side_effect=servers + [RuntimeError("port in use")]):
+        with pytest.raises(RuntimeError):
+            run_simulation(lifecycle_vms, ticks=5, grace=0)
+    for server in servers:
+        server.stop.assert_called_once_with(0)
+
+
+def test_unreachable_peer_is_a_lost_message(lifecycle_vms):
+    """Tests that a failed RPC in tick() is counted as a lost message instead of ending the clock loop."""
+    vm = VirtualMachine(lifecycle_vms[0])
+    vm.start()
+    # B and C are not running, so both sends fail.
+    with patch("main.random.randint", return_value=3):
+        vm.tick()
+    summary = vm.shutdown(grace=0)
+    assert summary["events"]["SEND"] == 1
+    assert summary["lost_messages"] == 2
+
+
+def test_run_simulation_shares_run_number(lifecycle_vms):
+    """Tests that all VMs of one simulation log under the same run number even when their file counters differ."""
+    open("log/A.0.log", "w").close()
+    open("log/B.1.log", "w").close()
+    run_simulation(lifecycle_vms, ticks=3, grace=0.5)
+    for name in ["A", "B", "C"]:
+        assert os.path.exists(f"log/{name}.2.log")
+    assert not os.path.exists("log/A.1.log")
+
+
+def test_vm_stop_event(lifecycle_vms):
+    """Tests that stop() ends a long run from another thread."""
+    vm = VirtualMachine(lifecycle_vms[0])
+    vm.start()
+    # Peers are not running, so sends must not reach the network.
+    with patch("main.send_message_to_peer"):
+        t = threading.Thread(target=vm.run, kwargs={"duration": 30})
+        t.start()
+        time.sleep(0.3)
+        vm.stop()
+        t.join(timeout=2)
+    assert not t.is_alive()
+
+    summary = vm.shutdown(grace=0)
+    assert summary["elapsed"] < 5
+    assert summary["ticks"] == sum(summary["events"].values())
+
+
+
+def test_run_simulation_stop_event(lifecycle_vms):
+    """Tests that a caller can end a whole simulation early through a stop event."""
+    stop_event = threading.Event()
+    threading.Timer(0.3, stop_event.set).start()
+    start = time.monotonic()
+    summaries = run_simulation(lifecycle_vms, duration=30, grace=0.5, stop_event=stop_event)
+
+    assert time.monotonic() - start < 5
+    for summary in summaries:
+        assert summary["error"] is None
+        assert summary["ticks"] == sum(summary["events"].values())
+
+
+def test_run_simulation_reports_tick_errors(lifecycle_vms):
+    """Tests that an exception in one VM's clock loop shows up in its summary."""
+    with patch("main.send_message_to_peer", side_effect=RuntimeError("peer down")), \
+         patch("main.random.randint", return_value=1):
+        summaries = run_simulation(lifecycle_vms, ticks=5, grace=0.5)
+
+    for summary in summaries:
+        assert isinstance(summary["error"], RuntimeError)
+        assert summary["ticks"] < 5
+
+
+def test_run_simulation_drops_undelivered_messages(lifecycle_vms):
+    """Tests that messages still delayed after the grace period are dropped before channels close."""
+    emulator = NetworkEmulator(default={"latency_ms": 60000})
+    # Every tick sends, so there are always delayed messages left at shutdown.
+    with patch("tools.network_emulator", emulator), patch("main.random.randint", return_value=1):
+        summaries = run_simulation(lifecycle_vms, ticks=5, grace=0.2)
+    assert emulator.scheduler.pending() == 0
+    assert all(summary["error"] is None for summary in summaries)
+
 
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,114 @@
+import os
+import pytest
+import pandas as pd
+
+from log_analysis import (iter_log_chunks, load_log_file, load_all_logs, summarize_logs, export_logs,
+                          peers_to_mask, mask_to_peers)
+
+SAMPLE_LOGS = {
+    "A.0.log": [
+        "2025-03-01 12:00:00 [A] [INTERNAL] Logical Clock: 1",
+        "2025-03-01 12:00:00 [A] [SEND    ] To: B, C, Logical Clock: 2",
+        "2025-03-01 12:00:01 [A] [RECEIVE ] from: B, Queue Length: 3, Logical Clock: 7",
+        "2025-03-01 12:00:01 [A] [INTERNAL] Logical Clock: 8",
+        "not a log line",
+        "2025-03-01 12:00:02 [A] [RECEIVE ] from: C, Queue Length: 1, Logical Clock: 12",
+    ],
+    "B.1.log": [
+        "2025-03-01 12:00:00 [B] [SEND    ] To: A, Logical Clock: 1",
+        "2025-03-01 12:00:00 [B] [INTERNAL] Logical Clock: 2",
+        "2025-03-01 12:00:01 [B] [RECEIVE ] from: A, Queue Length: 0, Logical Clock: 4",
+    ],
+}
+
+
+@pytest.fixture
+def log_directory(tmp_path):
+    """Fixture for a directory of small sample logs."""
+    for filename, lines in SAMPLE_LOGS.items():
+        (tmp_path / filename).write_text("\n".join(lines) + "\n")
+    return str(tmp_path)
+
+
+def test_peer_mask_round_trip():
+    """Tests that peer lists survive encoding as a bitmask."""
+    assert peers_to_mask(None) == 0
+    assert peers_to_mask(["A"]) == 1
+    assert peers_to_mask(["B", "C"]) == 0b110
+    assert mask_to_peers(peers_to_mask(["C", "Z"])) == ["C", "Z"]
+
+
+def test_load_all_logs_uses_compact_dtypes(log_directory):
+    """Tests that parsed logs use categoricals, int32 clocks and a peer bitmask."""
+    # A small chunksize makes sure the categoricals survive concatenating chunks of several files.
+    df = load_all_logs(log_directory, chunksize=2)
+
+    assert len(df) == 8
+    assert isinstance(df["vm"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["event_type"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["filename"].dtype, pd.CategoricalDtype)
+    assert list(df["filename"].cat.categories) == ["A.0.log", "B.1.log"]
+    assert df["logical_clock"].dtype == "int32"
+    assert df["recipient_mask"].dtype == "uint32"
+
+    send = df[(df["vm"] == "A") & (df["event_type"] == "SEND")].iloc[0]
+    assert mask_to_peers(send["recipient_mask"]) == ["B", "C"]
+    assert set(df.loc[df["vm"] == "B", "run"]) == {1}
+    assert df.loc[df["event_type"] == "RECEIVE", "queue_length"].tolist() == [3, 1, 0]
+
+
+def test_load_log_file(log_directory):
+    """Tests that a single file loads into the same compact columns."""
+    df = load_log_file(os.path.join(log_directory, "B.1.log"), chunksize=2)
+    assert df["logical_clock"].tolist() == [1, 2, 4]
+    assert isinstance(df["filename"].dtype, pd.CategoricalDtype)
+    assert mask_to_peers(df["recipient_mask"].iat[0]) == ["A"]
+
+
+def test_chunks_respect_chunksize(log_directory):
+    """Tests that a file is split into chunks of at most chunksize rows."""
+    chunks = list(iter_log_chunks(os.path.join(log_directory, "A.0.log"), chunksize=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert pd.concat(chunks)["logical_clock"].tolist() == [1, 2, 7, 8, 12]
+
+
+def test_summarize_logs_matches_in_memory(log_directory):
+    """Tests that chunked statistics match pandas describe() on the full data."""
+    summary = summarize_logs(log_directory, chunksize=2)
+    df = load_all_logs(log_directory)
+    df["clock_diff"] = df.groupby(["vm", "filename"], observed=True)["logical_clock"].diff()
+
+    for vm in ["A", "B"]:
+        expected = df.loc[df["vm"] == vm, "clock_diff"].astype(float).describe()
+        pd.testing.assert_series_equal(summary["clock_diff"][vm], expected, check_names=False)
+
+    expected = df.loc[(df["vm"] == "A") & (df["event_type"] == "RECEIVE"), "queue_length"].astype(float).describe()
+    pd.testing.assert_series_equal(summary["queue_length"]["A"], expected, check_names=False)
+
+
+
+def test_summarize_single_event_log(tmp_path):
+    """Tests that a VM without clock jumps gets the same all-NaN statistics as describe()."""
+    (tmp_path / "C.0.log").write_text("2025-03-01 12:00:00 [C] [INTERNAL] Logical Clock: 1\n")
+    summary = summarize_logs(str(tmp_path))
+    df = load_all_logs(str(tmp_path))
+    expected = df["logical_clock"].diff().astype(float).describe()
+    pd.testing.assert_series_equal(summary["clock_diff"]["C"], expected, check_names=False)
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_export_partitions_by_run_and_vm(log_directory, tmp_path, format):
+    """Tests that the export writes a dataset partitioned by run and VM."""
+    ds = pytest.importorskip("pyarrow.dataset")
+    output_directory = str(tmp_path / "export")
+    export_logs(log_directory, output_directory, format=format, chunksize=2)
+
+    assert os.path.isdir(os.path.join(output_directory, "run=0", "vm=A"))
+    assert os.path.isdir(os.path.join(output_directory, "run=1", "vm=B"))
+
+    dataset = ds.dataset(output_directory, format="ipc" if format == "arrow" else "parquet", partitioning="hive")
+    table = dataset.to_table(filter=ds.field("vm") == "A")
+    assert sorted(table.column("logical_clock").to_pylist()) == [1, 2, 7, 8, 12]
+
+
+if __name__ == "__main__":
+    pytest.main()
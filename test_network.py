@@ -0,0 +1,148 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+
+import logic_clock_pb2
+from network import DeliveryScheduler, NetworkEmulator, FaultInjectingStub, FaultInjectingServicer, wrap_stub, wrap_servicer
+
+
+class RecordingStub:
+    """Stand-in for VMServiceStub that records delivered requests."""
+
+    def __init__(self):
+        self.delivered = []
+
+    def SendMessage(self, request, timeout=None):
+        self.timeout = timeout
+        self.delivered.append(request.content)
+        return logic_clock_pb2.MessageReply(status="OK")
+
+
+def test_disabled_network_is_passthrough():
+    """Tests that no emulator is built and nothing is wrapped when emulation is off."""
+    assert NetworkEmulator.from_config(None) is None
+    assert NetworkEmulator.from_config({"enabled": False}) is None
+    stub, servicer = object(), object()
+    assert wrap_stub(stub, None, "A", "B") is stub
+    assert wrap_servicer(servicer, None, "A") is servicer
+
+
+def test_link_overrides():
+    """Tests that per-link settings override the default and '<->' sets both directions."""
+    emulator = NetworkEmulator(
+        default={"latency_ms": 10},
+        links={"A->B": {"drop_rate": 0.5}, "B<->C": {"latency_ms": 50}},
+    )
+    assert emulator.link("A", "B")["drop_rate"] == 0.5
+    assert emulator.link("A", "B")["latency_ms"] == 10
+    assert emulator.link("B", "A")["drop_rate"] == 0.0
+    assert emulator.link("B", "C")["latency_ms"] == 50
+    assert emulator.link("C", "B")["latency_ms"] == 50
+
+
+def test_invalid_link_options():
+    """Tests that unknown options and distributions are rejected."""
+    with pytest.raises(ValueError):
+        NetworkEmulator(default={"latency": 10})
+    with pytest.raises(ValueError):
+        NetworkEmulator(default={"distribution": "pareto"})
+    with pytest.raises(ValueError):
+        NetworkEmulator(links={"A->B": {"drop_rate": 2}})
+
+
+def test_partition_drops_messages():
+    """Tests that messages across a partition are dropped and healing restores delivery."""
+    emulator = NetworkEmulator(partitions=[["A"], ["B", "C"]])
+    stub = RecordingStub()
+    reply = FaultInjectingStub(stub, emulator, "A", "B").SendMessage(
+        logic_clock_pb2.MessageRequest(clock=1, content="A"))
+    assert reply.status == "DROPPED"
+    assert stub.delivered == []
+
+    # B and C share a partition.
+    assert not emulator.is_partitioned("B", "C")
+
+    emulator.set_partitions([])
+    reply = FaultInjectingStub(stub, emulator, "A", "B").SendMessage(
+        logic_clock_pb2.MessageRequest(clock=1, content="A"))
+    assert reply.status == "OK"
+    assert stub.delivered == ["A"]
+
+
+def test_drop_rate_is_seeded():
+    """Tests that the drop rate is roughly honoured and reproducible with a seed."""
+    def run():
+        emulator = NetworkEmulator(default={"drop_rate": 0.3}, seed=7)
+        return [emulator.should_drop("A", "B") for _ in range(1000)]
+
+    first = run()
+    assert first == run()
+    assert 200 < sum(first) < 400
+
+
+def test_delayed_messages_are_reordered():
+    """Tests that latency is applied off the caller's thread and that later messages can overtake."""
+    emulator = NetworkEmulator(links={"A->B": {"latency_ms": 200}})
+    stub = RecordingStub()
+    slow = FaultInjectingStub(stub, emulator, "A", "B")
+    fast = FaultInjectingStub(stub, emulator, "C", "B")
+
+    start = time.monotonic()
+    assert slow.SendMessage(logic_clock_pb2.MessageRequest(clock=1, content="A")).status == "DELAYED"
+    assert time.monotonic() - start < 0.1
+    fast.SendMessage(logic_clock_pb2.MessageRequest(clock=1, content="C"))
+
+    assert emulator.scheduler.flush(2.0)
+    assert stub.delivered == ["C", "A"]
+    assert emulator.scheduler.pending() == 0
+    # Delayed deliveries carry a deadline so a stuck peer cannot block the scheduler.
+    assert stub.timeout is not None
+
+
+def test_scheduler_survives_failed_delivery():
+    """Tests that a delivery raising a non-gRPC error is treated as lost, not fatal."""
+    scheduler = DeliveryScheduler()
+    delivered = []
+
+    def broken():
+        raise ValueError("Cannot invoke RPC on closed channel!")
+
+    scheduler.schedule(0.01, broken)
+    scheduler.schedule(0.02, delivered.append, "after")
+    assert scheduler.flush(1.0)
+    assert delivered == ["after"]
+
+
+def test_scheduler_clear():
+    """Tests that clear() drops pending messages so flush() returns at once."""
+    scheduler = DeliveryScheduler()
+    delivered = []
+    scheduler.schedule(10, delivered.append, "never")
+    assert scheduler.clear() == 1
+    assert scheduler.flush(0.1)
+    assert delivered == []
+
+
+def test_exponential_uses_latency_floor_and_jitter_mean():
+    """Tests that the exponential distribution never goes below latency and has mean latency + jitter."""
+    emulator = NetworkEmulator(default={"latency_ms": 10, "jitter_ms": 5, "distribution": "exponential"}, seed=1)
+    delays = [emulator.sample_delay("A", "B") * 1000 for _ in range(5000)]
+    assert min(delays) >= 10
+    assert 14 < sum(delays) / len(delays) < 16
+
+
+def test_servicer_rejects_partitioned_sender():
+    """Tests that the servicer wrapper aborts requests from a partitioned sender."""
+    emulator = NetworkEmulator(partitions=[["A"], ["B"]])
+    inner = MagicMock()
+    servicer = FaultInjectingServicer(inner, emulator, "B")
+    context = MagicMock()
+    context.abort.side_effect = Exception("aborted")
+
+    with pytest.raises(Exception):
+        servicer.SendMessage(logic_clock_pb2.MessageRequest(clock=1, content="A"), context)
+    inner.SendMessage.assert_not_called()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -3,17 +3,66 @@ import json
 import time
 import grpc
 import string
+import threading
 import logic_clock_pb2
 import logic_clock_pb2_grpc
+from network import DELIVERY_TIMEOUT, NetworkEmulator, wrap_stub
 
 vm_list = []
 vm_log_filename = {}
+network_emulator = None
+
+# One long-lived channel per target address; delayed deliveries from the
+# network emulator still need the channel after send_message_to_peer returns.
+_channels = {}
+_channels_lock = threading.Lock()
 
 def init():
     os.makedirs("log", exist_ok=True)
     with open('config.json', 'r') as f:
         config_data = json.load(f)
         return config_data["VMs"]
+
+def init_network():
+    """Build the network emulator from config.json, or None if it is disabled."""
+    with open('config.json', 'r') as f:
+        config_data = json.load(f)
+    return NetworkEmulator.from_config(config_data.get("network"))
+
+def get_channel(target_address):
+    with _channels_lock:
+        channel = _channels.get(target_address)
+        if channel is None:
+            channel = grpc.insecure_channel(target_address)
+            _channels[target_address] = channel
+        return channel
+
+def flush_outbound(timeout=None):
+    """
+    Wait for messages still held by the network emulator to be delivered.
+
+    :param float timeout: Maximum seconds to wait, or None to wait indefinitely.
+    :return bool: True if nothing is left in flight.
+    """
+    if network_emulator is None:
+        return True
+    return network_emulator.scheduler.flush(timeout)
+
+def drop_outbound():
+    """
+    Discard messages the network emulator has not delivered yet.
+
+    :return int: The number of messages dropped.
+    """
+    if network_emulator is None:
+        return 0
+    return network_emulator.scheduler.clear()
+
+def close_channels():
+    with _channels_lock:
+        for channel in _channels.values():
+            channel.close()
+        _channels.clear()
     
 def send_message_to_peer(name, clock, content = "test"):
     port = 50051
@@ -23,14 +72,15 @@ def send_message_to_peer(name, clock, content = "test"):
 
     target_address = "localhost:{}".format(port)
 
-    with grpc.insecure_channel(target_address) as channel:
-        stub = logic_clock_pb2_grpc.VMServiceStub(channel)
-        request = logic_clock_pb2.MessageRequest(
-            clock=clock,
-            content=content
-        )
-        response = stub.SendMessage(request)
-        # print("SendMessage response:", response.status)
+    # The content carries the sender's name, which selects the emulated link.
+    stub = logic_clock_pb2_grpc.VMServiceStub(get_channel(target_address))
+    stub = wrap_stub(stub, network_emulator, content, name)
+    request = logic_clock_pb2.MessageRequest(
+        clock=clock,
+        content=content
+    )
+    response = stub.SendMessage(request, timeout=DELIVERY_TIMEOUT)
+    # print("SendMessage response:", response.status)
 
 
 
@@ -41,7 +91,16 @@ def get_peers(name, lenth):
     return peers[:lenth] 
 
 
-def get_next_log_filename(vm_name):
+def get_next_log_filename(vm_name, run=None):
+    """
+    Pick the log file for a VM. Without a run number this is the VM's next unused index.
+
+    :param str vm_name: The VM's name.
+    :param int run: Run number shared by all VMs of one simulation, or None.
+    :return str: The log file path, e.g. log/A.3.log.
+    """
+    if run is not None:
+        return f"log/{vm_name}.{run}.log"
     i = 0
     filename = f"log/{vm_name}.{i}.log"
     while os.path.exists(filename):
@@ -49,6 +108,19 @@ def get_next_log_filename(vm_name):
         filename = f"log/{vm_name}.{i}.log"
     return filename
 
+def get_next_run_index(vm_names):
+    """
+    Find the first run number that none of the VMs has a log file for yet,
+    so one simulation's logs share a run number across VMs.
+
+    :param list vm_names: Names of the VMs taking part in the run.
+    :return int: The run number.
+    """
+    i = 0
+    while any(os.path.exists(f"log/{vm_name}.{i}.log") for vm_name in vm_names):
+        i += 1
+    return i
+
 def log_event(vm_name, event_type, logical_clock, queue_length=None, target_peers=None):
     """Log events to a file with timestamp and relevant information"""
     timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
@@ -67,4 +139,5 @@ def log_event(vm_name, event_type, logical_clock, queue_length=None, target_peer
         f.write(log_entry + "\n")
 
 
-vm_list = init()
\ No newline at end of file
+vm_list = init()
+network_emulator = init_network()
\ No newline at end of file